@@ -24,10 +24,10 @@ setup(
         "License :: OSI Approved :: GNU General Public License v3 (GPLv3)",
         "Topic :: Software Development",
         "Programming Language :: Python :: 3",
-        "Programming Language :: Python :: 3.7",
+        "Programming Language :: Python :: 3.8",
     ],
     packages=["zest"],
     include_package_data=True,
     install_requires=[],
-    python_requires=">=3.6",
+    python_requires=">=3.8",
 )
@@ -1,3 +1,5 @@
+import sys
+
 blue = "\u001b[34m"
 yellow = "\u001b[33m"
 red = "\u001b[31m"
@@ -7,3 +9,7 @@ cyan = "\u001b[36m"
 magenta = "\u001b[35m"
 bold = "\u001b[1m"
 reset = "\u001b[0m"
+
+# No escape codes when the output is not going to a terminal (eg. CI logs)
+if sys.stdout is None or not sys.stdout.isatty():
+    blue = yellow = red = green = gray = cyan = magenta = bold = reset = ""
@@ -3,6 +3,7 @@ A function-oriented testing framework for Python 3.
 
 See README.md
 """
+import atexit
 import logging
 import os
 import sys
@@ -13,32 +14,43 @@ import traceback
 import io
 import re
 import json
+import pickle
+import struct
 import tempfile
 import shutil
 import dataclasses
 import ctypes
 import tempfile
 from tempfile import NamedTemporaryFile
-from functools import wraps
+from functools import wraps, cached_property
 from contextlib import contextmanager
 from random import shuffle
 
 
 log_fp = None
-log_last_time = None
+log_enabled = bool(os.environ.get("ZEST_LOG"))
 
 
 def log(*args):
-    global log_fp, log_last_time
+    """
+    Debugging log to zest_log.txt, only written when ZEST_LOG is set in the
+    environment. The file is block-buffered; it is flushed at exit and
+    before every fork. Children that leave with os._exit call flush_log().
+    """
+    global log_fp
+    if not log_enabled:
+        return
     if log_fp is None:
-        log_fp = open("zest_log.txt", "a")
-    delta = 0
-    if log_last_time is not None:
-        delta = time.time() - log_last_time
-    log_last_time = time.time()
-    #log_fp.write(f"{delta:3.1f} " + "".join([str(i) + " " for i in args]) + "\n")
+        log_fp = open("zest_log.txt", "a", buffering=1 << 16)
+        atexit.register(log_fp.close)
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(before=flush_log)
     log_fp.write("".join([str(i) + " " for i in args]) + "\n")
-    log_fp.flush()
+
+
+def flush_log():
+    if log_fp is not None:
+        log_fp.flush()
 
 
 ansi_escape = re.compile(r"(?:\x1B[@-_]|[\x80-\x9F])[0-?]*[ -/]*[@-~]")
@@ -389,6 +401,19 @@ class ZestResult:
     is_starting: bool = False
     worker_i: int = 0
 
+    @cached_property
+    def name_parts(self):
+        """The full_name split on dots, computed once and shared by all displays"""
+        return self.full_name.split(".")
+
+    @cached_property
+    def error_lines(self):
+        """The error_formatted traceback split into lines, computed once and shared by all displays"""
+        lines = []
+        for line in self.error_formatted or [""]:
+            lines += line.strip().split("\n")
+        return lines
+
     def dumps(self):
         return json.dumps(self, cls=JSONDataClassEncoder)
 
@@ -396,6 +421,25 @@ class ZestResult:
     def loads(cls, s):
         return ZestResult(**json.loads(s))
 
+    def dumps_fast(self):
+        """
+        Binary form for the event streams: a 4-byte length prefix followed
+        by a pickle of the fields. Use dumps() for anything a human reads.
+        """
+        payload = pickle.dumps(
+            {name: getattr(self, name) for name in _zest_result_field_names},
+            protocol=5,
+        )
+        return _zest_result_len.pack(len(payload)) + payload
+
+    @classmethod
+    def loads_fast(cls, b):
+        return ZestResult(**pickle.loads(b))
+
+
+_zest_result_field_names = tuple(f.name for f in dataclasses.fields(ZestResult))
+_zest_result_len = struct.Struct("<I")
+
 
 def check_allow_to_run(allow_list, test_name_parts):
     full_name = ".".join(test_name_parts)
@@ -531,11 +575,37 @@ class zest:
         def decorator(fn):
             @wraps(fn)
             def wrapper(*args, **kwargs):
+                # Anything still buffered would otherwise be inherited by the
+                # child and written a second time when it exits
+                sys.stdout.flush()
+                sys.stderr.flush()
+                libc.fflush(None)
                 child_pid = os.fork()
                 if child_pid == 0:
-                    # child process
-                    fn(*args, **kwargs)
-                    sys.exit(0)
+                    # child process. It leaves with os._exit so that it does not
+                    # unwind back into the parent's zest.do (whose cleanup would
+                    # remove the parent's tmp folder). The exit status is the one
+                    # sys.exit() would give so that sys.exit(0) is a success.
+                    ret_code = 0
+                    try:
+                        fn(*args, **kwargs)
+                    except SystemExit as e:
+                        if e.code is None:
+                            ret_code = 0
+                        elif isinstance(e.code, int):
+                            ret_code = e.code
+                        else:
+                            print(e.code, file=sys.stderr)
+                            ret_code = 1
+                    except BaseException:
+                        traceback.print_exc()
+                        ret_code = 1
+                    finally:
+                        sys.stdout.flush()
+                        sys.stderr.flush()
+                        libc.fflush(None)
+                        flush_log()
+                        os._exit(ret_code)
 
                 pid, ret_code = os.waitpid(child_pid, 0)
                 if ret_code != 0:
@@ -833,7 +903,7 @@ class zest:
                             mock_tuple[3].reset()  # Tell the mock to reset
 
                 with stdio_and_log_capture(zest._capture) as (so, se, lg):
-                    zest._call_stack += [name]
+                    zest._call_stack.append(name)
                     zest._current_error = None
 
                     try:
@@ -873,18 +943,18 @@ class zest:
                             try:
                                 _before()
                             except Exception as e:
-                                zest._call_errors += [(e, zest._call_stack.copy())]
+                                zest._call_errors.append((e, zest._call_stack.copy()))
                                 s = (
                                     f"There was an exception while running '_before()' in test '{name}'. "
                                     f"This may mean that the sub-tests are not enumerated and therefore can not be run."
                                 )
-                                zest._call_warnings += [s]
+                                zest._call_warnings.append(s)
                                 if zest._bubble_exceptions:
                                     raise e
 
                         try:
-                            zest._call_tree += [full_name]
-                            zest._call_log += [full_name]
+                            zest._call_tree.append(full_name)
+                            zest._call_log.append(full_name)
 
                             if zest._test_start_callback:
                                 with pause_stdio_capture():
@@ -906,7 +976,7 @@ class zest:
                             skip_reason = None
                             start_time = time.time()
                             try:
-                                zest._mock_stack += [[]]
+                                zest._mock_stack.append([])
 
                                 try:
                                     func()
@@ -918,9 +988,9 @@ class zest:
                             except Exception as e:
                                 error = e
                                 error_formatted = traceback.format_exception(
-                                    etype=type(error), value=error, tb=error.__traceback__
+                                    type(error), error, error.__traceback__
                                 )
-                                zest._call_errors += [1]
+                                zest._call_errors.append(1)
                                 # zest._call_errors += [
                                 #     (e, error_formatted, zest._call_stack.copy())
                                 # ]
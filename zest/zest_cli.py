@@ -6,16 +6,11 @@ import time
 import os
 import sys
 import argparse
-import pathlib
 import json
 import logging
 import logging.config
-from pathlib import Path
 from zest import zest_finder
 from zest.zest_runner_single_thread import ZestRunnerSingleThread
-from zest.zest_runner_multi_thread import ZestRunnerMultiThread
-from zest.zest_display import display_find_errors, display_complete
-from zest import zest_console_ui
 from zest.zest import log
 from . import __version__
 
@@ -129,23 +124,35 @@ def main():
 
     # fmt: on
 
-    kwargs = vars(parser.parse_args())
+    args = parser.parse_args()
 
-    if kwargs.pop("version", None):
+    if args.version:
         print(__version__)
         sys.exit(0)
 
     # zest needs a way to ask the application to setup logging
-    hook = kwargs.get("hook_start")
-    if hook is not None:
-        hook_file, func_name = hook.split(":")
+    if args.hook_start is not None:
+        hook_file, func_name = args.hook_start.split(":")
         hook_start_func = zest_finder.load_module(func_name, "", hook_file)
         hook_start_func()
 
-    if not kwargs.pop("no_ui", False) and (kwargs.pop("ui", False) or kwargs.get("go", False)):
+    # Everything except the CLI-only switches is passed through to the runners
+    kwargs = {
+        key: val
+        for key, val in vars(args).items()
+        if key not in ("version", "ui", "no_ui")
+    }
+
+    # The console UI (curses) and the multi-process runner are imported
+    # only when requested so that the common single-threaded run starts fast.
+    if not args.no_ui and (args.ui or args.go):
+        from zest import zest_console_ui
+
         retcode = zest_console_ui.run(**kwargs)
     else:
-        if kwargs.get("n_workers") > 1:
+        if args.n_workers > 1:
+            from zest.zest_runner_multi_thread import ZestRunnerMultiThread
+
             runner = ZestRunnerMultiThread(**kwargs)
             from zest.zest import zest
 
@@ -158,27 +165,4 @@ def main():
 
 
 if __name__ == "__main__":
-    allow_reentrancy = True
-    if allow_reentrancy:
-        main()
-    else:
-        pidfile = f"{Path.home()}/zest_runner.pid"
-        pid = str(os.getpid())
-        if os.path.isfile(pidfile):
-            print(f"{pidfile} already exists {sys.argv}", file=sys.stderr)
-            sys.exit(1)
-
-        with open(pidfile, "w") as f:
-            f.write(pid)
-
-        try:
-            main()
-        finally:
-            found_pid = 0
-            with open(pidfile) as f:
-                try:
-                    found_pid = f.read()
-                except Exception as e:
-                    pass
-            if str(found_pid) == str(pid):
-                os.unlink(pidfile)
+    main()
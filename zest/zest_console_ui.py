@@ -3,7 +3,6 @@ Console UI.
 """
 
 import itertools
-import copy
 import time
 import sys
 import os
@@ -18,14 +17,15 @@ from collections import defaultdict
 from zest.zest import log, strip_ansi, zest
 from zest.zest_display import colorful_exception, traceback_match_filename
 from zest.zest_runner_single_thread import ZestRunnerSingleThread
+from zest.zest_runner_base import read_zest_result_line
 from zest.zest_runner_multi_thread import (
     ZestRunnerMultiThread,
-    read_zest_result_line,
     clear_output_folder,
 )
 from . import __version__
 
 if os.name == "nt":
+    import ctypes
     import msvcrt
 else:
     import select
@@ -35,15 +35,29 @@ scr = None
 ansi_escape = re.compile(r"(?:\x1B[@-_]|[\x80-\x9F])[0-?]*[ -/]*[@-~]")
 
 
-def _kbhit():
+def _kbhit(timeout=0.1):
     """
     Returns True if a keypress is waiting to be read in stdin, False otherwise.
+    Blocks up to timeout seconds waiting for one so that the UI loop sleeps
+    rather than spins.
     Base on: https://stackoverflow.com/a/55692274
     """
     if os.name == "nt":
-        return msvcrt._kbhit()
+        # Sleep on the console input handle. It is also signaled by events
+        # other than key presses (mouse, focus, key up) so re-check kbhit()
+        # and back off briefly after such a wake until the deadline.
+        handle = msvcrt.get_osfhandle(sys.stdin.fileno())
+        deadline = time.monotonic() + timeout
+        while not msvcrt.kbhit():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            ctypes.windll.kernel32.WaitForSingleObject(handle, int(remaining * 1000))
+            if not msvcrt.kbhit():
+                time.sleep(0.01)
+        return True
     else:
-        dr, dw, de = select.select([sys.stdin], [], [], 0.1)
+        dr, dw, de = select.select([sys.stdin], [], [], timeout)
         return dr != []
 
 
@@ -154,6 +168,10 @@ pal = [
 
 ]
 
+# The curses attribute (pal flags | color pair) of each pal entry, filled once
+# the color pairs are initialized so that _print does not recompute them
+_pal_attr = []
+
 
 def addstr(y, x, txt, mode):
     try:
@@ -173,10 +191,10 @@ def _print(y, x, *args):
     width = curses.COLS
     _y = y
     _x = x
-    mode = pal[PAL_MENU][2] | curses.color_pair(PAL_MENU)
+    mode = _pal_attr[PAL_MENU]
     for arg in args:
         if isinstance(arg, int):
-            mode = pal[arg][2] | curses.color_pair(arg)
+            mode = _pal_attr[arg]
         else:
             arg = str(arg)
             lines = arg.split("\n")
@@ -355,11 +373,7 @@ def draw_fail_lines(y, fails_panel_page, zest_results_by_full_name, root, show_r
                 break
 
             name = error.full_name
-            formatted = error.error_formatted
-
-            lines = []
-            for line in formatted:
-                lines += [sub_line for sub_line in line.strip().split("\n")]
+            lines = error.error_lines
 
             if len(lines) >= 3:
                 last_filename_line = lines[-3]
@@ -464,10 +478,7 @@ def draw_result_details(y, detail_panel_scroll_top, root, zest_result):
         _print(y, 0, PAL_SUCCESS, "Passed!")
         y += 1
     else:
-        formatted = zest_result.error_formatted
-        lines = []
-        for line in formatted:
-            lines += [sub_line for sub_line in line.strip().split("\n")]
+        lines = zest_result.error_lines
 
         s = [
             PAL_NONE,
@@ -545,9 +556,11 @@ def load_results(zest_results_path):
     zest_results = []
     paths = sorted(Path(zest_results_path).iterdir(), key=os.path.getmtime)
     for res_path in paths:
-        with open(res_path) as fd:
+        if res_path.suffix != ".evt":
+            continue
+        with open(res_path, "rb") as fd:
             for zest_result in read_zest_result_line(fd):
-                zest_results += [(zest_result.full_name, zest_result)]
+                zest_results.append((zest_result.full_name, zest_result))
 
     zest_results_by_full_name = OrderedDict(zest_results)
     return zest_results_by_full_name
@@ -614,7 +627,10 @@ def _run(
         if not dirty:
             return
         dirty = False
-        scr.clear()
+        # erase() rather than clear(): clear() forces curses to repaint the
+        # whole terminal on refresh whereas after erase() the refresh only
+        # sends the cells that differ from what is already on screen.
+        scr.erase()
         y = draw_title_bar(debug_mode)
         y = draw_status(y, run_state, match_string, current_running_tests_by_worker_i, n_workers)
         y = draw_summary(y, n_success, n_errors, n_skips)
@@ -633,7 +649,7 @@ def _run(
             y = 10
             x = (scr_w - w) // 2
             win2 = scr.subwin(h, w, y, x)
-            win2.clear()
+            win2.erase()
 
             if n_errors == 0:
                 win2.attrset(curses.color_pair(PAL_SUCCESS_BOX))
@@ -737,8 +753,9 @@ def _run(
             #    * request_stop: Goto STOPPING
             #    * the "runner_thread" has terminated. Goto STOPPED
             #    * a new run is requested before the current run has terminated. Goto STOPPING
-            running = runner.poll(request_stop)
-            time.sleep(0.05)
+            # Block on the result queue rather than sleeping so that an
+            # event is rendered as soon as it arrives
+            running = runner.poll(request_stop, timeout=0.05)
 
             if not running and not request_end:
                 nonlocal show_result_box
@@ -773,8 +790,9 @@ def _run(
     for i, p in enumerate(pal):
         if i > 0:
             curses.init_pair(i, pal[i][0], pal[i][1])
+    _pal_attr[:] = [attr | curses.color_pair(i) for i, (_, _, attr) in enumerate(pal)]
 
-    zest_results_path.mkdir(parents=True, exist_ok=True)
+    os.makedirs(zest_results_path, exist_ok=True)
     zest_results_by_full_name = load_results(zest_results_path)
 
     while True:
@@ -783,7 +801,15 @@ def _run(
                 break
 
             render()
-            if _kbhit():
+
+            # While tests are running the loop must come back around soon to
+            # pump results; otherwise it only needs to wake for a key press.
+            if run_state in (LOADING, RUNNING, STOPPING):
+                input_timeout = 0.05
+            else:
+                input_timeout = 0.5
+
+            if _kbhit(input_timeout):
                 key = scr.getkey()
 
                 if show_result_box:
@@ -930,9 +956,7 @@ def run(**kwargs):
 
         except Exception as e:
             print("\033c\033[3J\033[2J\033[0m\033[H")
-            formatted = traceback.format_exception(
-                etype=type(e), value=e, tb=e.__traceback__
-            )
+            formatted = traceback.format_exception(type(e), e, e.__traceback__)
             colorful_exception(e, formatted, gray_libs=False)
             break
 
@@ -3,45 +3,127 @@ import sys
 import os
 import re
 import io
+import heapq
 import traceback
+from operator import itemgetter
+from contextlib import contextmanager
+from functools import lru_cache
 from zest.zest import log
 
 
+# Style prefixes that are used together on hot display paths
+_BOLD_YELLOW = colors.bold + colors.yellow
+_RED_BOLD = colors.red + colors.bold
+_YELLOW_BOLD = colors.yellow + colors.bold
+_MAGENTA_BOLD = colors.magenta + colors.bold
+_ERROR_TAG = colors.bold + colors.red + "ERROR" + colors.gray
+_SUCCESS_TAG = colors.green + "SUCCESS" + colors.gray
+_FAIL_MARK = colors.bold + colors.red + "F"
+_SKIP_MARK = colors.yellow + "s"
+_SUCCESS_DOT = colors.green + "."
+
+
+# When not None, s() appends here instead of writing. See batch()
+_batch_buf = None
+
+
 def s(*strs):
-    for str_ in strs:
-        if str_ is not None:
-            sys.stdout.write(str_)
-    sys.stdout.write(colors.reset)
+    text = "".join([str_ for str_ in strs if str_ is not None]) + colors.reset
+    if _batch_buf is not None:
+        _batch_buf.append(text)
+        return
+    sys.stdout.write(text)
     sys.stdout.flush()
 
 
-_tb_pat = re.compile(r"^.*File \"([^\"]+)\", line (\d+), in (.*)")
+@contextmanager
+def batch():
+    """
+    Collect everything that s() writes inside the block and write it all at
+    once on exit. Nested batches join the outermost one. Also usable as a
+    decorator (@batch()) for the multi-call display functions.
+    """
+    global _batch_buf
+    if _batch_buf is not None:
+        yield
+        return
+
+    _batch_buf = []
+    try:
+        yield
+    finally:
+        text = "".join(_batch_buf)
+        _batch_buf = None
+        sys.stdout.write(text)
+        sys.stdout.flush()
+
+
+def write_raw(text):
+    """
+    Write text straight to the stdout fd with os.write, bypassing the
+    TextIOWrapper locking and buffering. Anything already buffered in
+    sys.stdout is flushed first so that ordering is preserved.
+    """
+    sys.stdout.flush()
+    try:
+        fileno = sys.stdout.fileno()
+    except (AttributeError, io.UnsupportedOperation):
+        sys.stdout.write(text)
+        sys.stdout.flush()
+        return
+
+    data = memoryview(text.encode())
+    while len(data) > 0:
+        data = data[os.write(fileno, data):]
+
+
+# Not anchored with a leading ".*" so that search() does not have to
+# scan to the end of the line and backtrack
+_tb_pat = re.compile(r"File \"([^\"]+)\", line (\d+), in (.*)")
+
+_real_and_rel_paths = {}
+
+
+def _real_and_rel_path(file):
+    """
+    Memoized (realpath, relpath) of a traceback filename. Tracebacks keep
+    repeating the same files and each resolution stats every path component.
+    """
+    paths = _real_and_rel_paths.get(file)
+    if paths is None:
+        real_path = os.path.realpath(file)
+        paths = (real_path, os.path.relpath(real_path))
+        _real_and_rel_paths[file] = paths
+    return paths
 
 
+# The console UI re-renders the same tracebacks on every redraw
+@lru_cache(maxsize=4096)
 def traceback_match_filename(root, line):
-    m = _tb_pat.match(line)
+    m = _tb_pat.search(line)
     if m:
         file = m.group(1)
         lineno = m.group(2)
         context = m.group(3)
-        file = os.path.relpath(os.path.realpath(file))
+        real_path, file = _real_and_rel_path(file)
 
         is_libs = True
-        real_path = os.path.realpath(file)
         if real_path.startswith(root) and os.path.exists(real_path):
             is_libs = False
 
-        if "/site-packages/" in file:
-            # Treat these long but commonly occurring path differently
-            file = re.sub(r".*/site-packages/", ".../", file)
+        # Treat these long but commonly occurring path differently
+        _, site_packages, tail = file.rpartition("/site-packages/")
+        if site_packages:
+            file = ".../" + tail
         leading, basename = os.path.split(file)
         leading = f"{'./' if len(leading) > 0 and leading[0] != '.' else ''}{leading}"
         return leading, basename, lineno, context, is_libs
     return None
 
 
-def error_header(edge, edge_style, label, width=None):
-    term_width = tty_size()[1]
+def error_header(edge, edge_style, label, width=None, term_width=None):
+    if term_width is None:
+        term_width = tty_size()[1]
     if width is None:
         width = term_width
     width = min(width, term_width)
@@ -57,21 +139,17 @@ def error_header(edge, edge_style, label, width=None):
     )
 
 
-_tty_size_cache = None
-
-
 def tty_size():
-    global _tty_size_cache
-    if _tty_size_cache is None:
-        process = os.popen("stty size", "r")
-        lines = process.read()
-        retcode = process.close()
-        if retcode is None:
-            rows, cols = lines.split()
-        else:
-            rows, cols = 50, 80
-        _tty_size_cache = (int(rows), int(cols))
-    return _tty_size_cache
+    # An ioctl on stdout (or stdin, which is what stty used) instead of
+    # forking a "stty size" subprocess. Cheap enough to not need a cache,
+    # which would also need a SIGWINCH handler to notice resizes.
+    for fd in (1, 0):
+        try:
+            size = os.get_terminal_size(fd)
+            return size.lines, size.columns
+        except OSError:
+            pass
+    return 50, 80
 
 
 def display_find_errors(errors):
@@ -98,22 +176,22 @@ def display_find_errors(errors):
     )
 
 
+@batch()
 def display_error(root, zest_result):
-    stack = zest_result.full_name.split(".")
+    stack = zest_result.name_parts
     leaf_test_name = stack[-1]
     formatted_test_name = " . ".join(stack[0:-1]) + colors.bold + " . " + leaf_test_name
+    term_width = tty_size()[1]
 
-    s("\n\n", error_header("=", colors.cyan, formatted_test_name), "\n")
+    s("\n\n", error_header("=", colors.cyan, formatted_test_name, None, term_width), "\n")
 
     if zest_result.error is not None:
-        s("\n", error_header("-", colors.yellow, "stdout", 40), "\n")
+        s("\n", error_header("-", colors.yellow, "stdout", 40, term_width), "\n")
         s(zest_result.stdout)
-        s("\n", error_header("-", colors.yellow, "stderr", 40), "\n")
+        s("\n", error_header("-", colors.yellow, "stderr", 40, term_width), "\n")
         s(zest_result.stderr)
 
-    lines = []
-    for line in zest_result.error_formatted or [""]:
-        lines += [sub_line for sub_line in line.strip().split("\n")]
+    lines = zest_result.error_lines
 
     is_libs = False
     for line in lines[1:-1]:
@@ -128,36 +206,28 @@ def display_error(root, zest_result):
                 s(colors.gray, " in function ")
                 s(colors.gray, context, "\n")
             else:
-                s(
-                    "File ",
-                    colors.yellow,
-                    leading,
-                    "/ ",
-                    colors.yellow,
-                    colors.bold,
-                    basename,
-                )
+                s("File ", colors.yellow, leading, "/ ", _YELLOW_BOLD, basename)
                 s(":", colors.yellow, lineno)
                 s(" in function ")
                 if leaf_test_name == context:
-                    s(colors.red, colors.bold, context, "\n")
+                    s(_RED_BOLD, context, "\n")
                 else:
-                    s(colors.magenta, colors.bold, context, "\n")
+                    s(_MAGENTA_BOLD, context, "\n")
 
-    s(
-        colors.red,
-        "raised: ",
-        colors.red,
-        colors.bold,
-        zest_result.error.__class__.__name__,
-        "\n",
-    )
+    s(colors.red, "raised: ", _RED_BOLD, zest_result.error.__class__.__name__, "\n")
     error_message = str(zest_result.error).strip()
     if error_message != "":
         s(colors.red, error_message, "\n")
     s()
 
 
+_INDENTS = tuple("  " * depth for depth in range(64))
+
+
+def _indent(depth):
+    return _INDENTS[depth] if depth < 64 else "  " * depth
+
+
 def display_start(name, last_depth, curr_depth, add_markers):
     if last_depth is not None and curr_depth is not None:
         if last_depth < curr_depth:
@@ -166,42 +236,40 @@ def display_start(name, last_depth, curr_depth, add_markers):
     if curr_depth is None:
         curr_depth = 0
     marker = "+" if add_markers else ""
-    s("  " * curr_depth, colors.yellow, marker + name, colors.reset, ": ")
+    s(_indent(curr_depth), colors.yellow, marker + name, colors.reset, ": ")
     # Note, no \n on this line because it will be added on the display_stop call
 
 
+@batch()
 def display_stop(error, elapsed, skip, last_depth, curr_depth):
     if elapsed is None:
         elapsed = 0.0
     if last_depth is not None and curr_depth is not None:
         if curr_depth < last_depth:
-            s(f"{'  ' * curr_depth}")
+            s(_indent(curr_depth))
     if isinstance(error, str) and error.startswith("skipped"):
-        s(colors.bold, colors.yellow, error)
+        s(_BOLD_YELLOW, error)
     elif skip is not None:
-        s(colors.bold, colors.yellow, "SKIPPED (reason: ", skip, ")")
+        s(_BOLD_YELLOW, "SKIPPED (reason: ", skip, ")")
     elif error:
-        s(
-            colors.bold,
-            colors.red,
-            "ERROR",
-            colors.gray,
-            f" (in {int(1000.0 * elapsed)} ms)",
-        )
+        s(_ERROR_TAG, f" (in {int(1000.0 * elapsed)} ms)")
     else:
-        s(colors.green, "SUCCESS", colors.gray, f" (in {int(1000.0 * elapsed)} ms)")
+        s(_SUCCESS_TAG, f" (in {int(1000.0 * elapsed)} ms)")
     s("\n")
 
 
 def display_abbreviated(error, skip):
+    # Each mark is written and flushed straight away so that progress and
+    # ordering with uncaptured output are kept
     if error:
-        s(colors.bold, colors.red, "F")
+        s(_FAIL_MARK)
     elif skip:
-        s(colors.yellow, "s")
+        s(_SKIP_MARK)
     else:
-        s(colors.green, ".")
+        s(_SUCCESS_DOT)
 
 
+@batch()
 def display_complete(root, zest_results):
     results_with_errors = [res for res in zest_results if res.error]
 
@@ -221,12 +289,15 @@ def display_complete(root, zest_results):
 def display_timings(results):
     s("Slowest 5%\n")
     n_timings = len(results)
-    timings = [(result.full_name, result.elapsed) for result in results]
-    timings.sort(key=lambda tup: tup[1])
-    ninety_percentile = 95 * n_timings // 100
-    for i in range(n_timings - 1, ninety_percentile, -1):
-        name = timings[i]
-        s("  ", name[0], colors.gray, f" {int(1000.0 * name[1])} ms)\n")
+    n_slowest = n_timings - 1 - 95 * n_timings // 100
+    # Only the slowest few are shown so select them instead of sorting all
+    timings = heapq.nlargest(
+        n_slowest,
+        ((result.full_name, result.elapsed) for result in results),
+        key=itemgetter(1),
+    )
+    for name, elapsed in timings:
+        s("  ", name, colors.gray, f" {int(1000.0 * elapsed)} ms)\n")
 
 
 def display_warnings(call_warnings):
@@ -248,17 +319,14 @@ def colorful_exception(
         nonlocal accum
         accum += "".join(strs) + colors.reset
 
-    tb_pat = re.compile(r"^.*File \"([^\"]+)\", line (\d+), in (.*)")
-
     def _traceback_match_filename(line):
         is_libs = False
-        m = tb_pat.match(line)
+        m = _tb_pat.search(line)
         if m:
             file = m.group(1)
             lineno = m.group(2)
             context = m.group(3)
-            real_path = os.path.realpath(file)
-            relative_path = os.path.relpath(real_path)
+            real_path, relative_path = _real_and_rel_path(file)
 
             root = os.environ.get("ERISYON_ROOT")
             if root is not None:
@@ -268,10 +336,14 @@ def colorful_exception(
                     is_libs = False
 
             # Treat these long but commonly occurring path differently
-            if "/site-packages/" in relative_path:
-                relative_path = re.sub(r".*/site-packages/", ".../", relative_path)
-            if "/dist-packages/" in relative_path:
-                relative_path = re.sub(r".*/dist-packages/", ".../", relative_path)
+            # (rpartition keeps what follows the last occurrence, same as the
+            # greedy ".*/site-packages/" substitution did)
+            _, site_packages, tail = relative_path.rpartition("/site-packages/")
+            if site_packages:
+                relative_path = ".../" + tail
+            _, dist_packages, tail = relative_path.rpartition("/dist-packages/")
+            if dist_packages:
+                relative_path = ".../" + tail
 
             leading, basename = os.path.split(relative_path)
             # if leading and len(leading) > 0:
@@ -285,13 +357,15 @@ def colorful_exception(
     if hasattr(error, "_root_name"):
         s(colors.red, colors.bold, f"DURING ATTEMPT TO RUN {error._root_name}\n")
 
-    if formatted is None:
-        formatted = traceback.format_exception(
-            etype=type(error), value=error, tb=error.__traceback__
+    if hasattr(error, "_tb_frames"):
+        # Raised in a worker which only sent the frames; format them here
+        formatted = (
+            ["Traceback (most recent call last):\n"]
+            + error._tb_frames.format()
+            + traceback.format_exception_only(type(error), error)
         )
-
-    if hasattr(error, "_formatted"):
-        formatted = error._formatted
+    elif formatted is None:
+        formatted = traceback.format_exception(type(error), error, error.__traceback__)
 
     lines = []
     for line in formatted:
@@ -4,12 +4,17 @@ Find and parse zests
 
 import os
 import ast
-import pkgutil
+import hashlib
+import math
+import multiprocessing
+import pickle
+import re
 import sys
 from typing import List
 from dataclasses import dataclass
 from importlib import util
 from zest.zest import log, check_allow_to_run
+from zest.version import __version__
 
 
 def _walk_include_dirs(root, include_dirs):
@@ -22,13 +27,44 @@ def _walk_include_dirs(root, include_dirs):
             Root folder
         include_dirs: String
             Colon-delimited list of paths to search relative to root
+
+    Yields:
+        (zests folder, sorted list of the module names of its .py files)
     """
     for folder in (include_dirs or "").split(":"):
-        for curr, dirs, _ in os.walk(os.path.abspath(os.path.join(root, folder))):
-            # os.walk allows modifying the dirs. In this case, skip hidden
-            dirs[:] = [d for d in dirs if d[0] != "."]
-            if curr.endswith("/zests"):
-                yield curr
+        # An explicit stack of os.scandir() calls rather than os.walk so that
+        # the entry type comes from the directory listing with no extra stat.
+        # The same listing provides the modules (instead of pkgutil re-listing).
+        stack = [os.path.abspath(os.path.join(root, folder))]
+        while stack:
+            curr = stack.pop()
+            is_zests = curr.endswith("/zests")
+            sub_dirs = []
+            module_names = []
+            try:
+                with os.scandir(curr) as it:
+                    for entry in it:
+                        name = entry.name
+                        if name[0] == ".":
+                            # Skip hidden
+                            continue
+                        if entry.is_dir(follow_symlinks=False):
+                            # Do not follow symlinks (same as os.walk)
+                            sub_dirs += [entry.path]
+                        elif is_zests and name.endswith(".py") and entry.is_file():
+                            module_name = name[:-3]
+                            if module_name != "__init__" and "." not in module_name:
+                                module_names += [module_name]
+            except OSError:
+                continue
+
+            if is_zests:
+                # Sorted to visit modules in the same order as pkgutil did
+                module_names.sort()
+                yield curr, module_names
+
+            # Reversed so that the pops visit them in listing order
+            stack += reversed(sub_dirs)
 
 
 @dataclass
@@ -40,6 +76,37 @@ class FoundZest:
     skip: str = None
 
 
+_With = ast.With
+_FunctionDef = ast.FunctionDef
+_Expr = ast.Expr
+_Call = ast.Call
+_Name = ast.Name
+_Attribute = ast.Attribute
+
+
+def _extract_groups_and_skip(decorator_list):
+    """
+    Find the @zest.group(...) and @zest.skip(...) decorators of a test function.
+
+    Returns:
+        (list of group names, skip reason or None)
+    """
+    groups = []
+    skip_reason = None
+    for dec in decorator_list:
+        if type(dec) is not _Call or type(dec.func) is not _Attribute:
+            continue
+        attr = dec.func.attr
+        if attr == "group":
+            groups += [dec.args[0].value]
+        elif attr == "skip":
+            if len(dec.args) == 1:
+                skip_reason = dec.args[0].value
+            else:
+                skip_reason = dec.keywords[0].value.value
+    return groups, skip_reason
+
+
 def _recurse_ast(path, lineno, body, func_name=None, parent_name=None):
     """
     TODO
@@ -130,34 +197,25 @@ def _recurse_ast(path, lineno, body, func_name=None, parent_name=None):
     found_zests = []
     errors = []
 
-    for i, part in enumerate(body):
-        if isinstance(part, ast.With):
+    # Each statement is at most one of these kinds so the checks are
+    # chained; only statements (never expressions) are visited.
+    # The parser only produces these exact node classes so "type() is" is
+    # used rather than the slower isinstance().
+    for part in body:
+        part_type = type(part)
+        if part_type is _With:
             _found_zests, _errors = _recurse_ast(path, part.lineno, part.body, func_name, parent_name)
             found_zests += _found_zests
             errors += _errors
 
-        if isinstance(part, ast.FunctionDef):
-            this_zest_groups = []
-            this_zest_skip_reason = None
-
+        elif part_type is _FunctionDef:
             if (is_module_level and part.name.startswith("zest_")) or (
                 not is_module_level and not part.name.startswith("_")
             ):
                 this_zest_name = part.name
-
-                if part.decorator_list:
-                    for dec in part.decorator_list:
-                        if isinstance(dec, ast.Call):
-                            if isinstance(dec.func, ast.Attribute):
-                                if dec.func.attr == "group":
-                                    group = dec.args[0].s
-                                    this_zest_groups += [group]
-                                elif dec.func.attr == "skip":
-                                    if len(dec.args) == 1:
-                                        reason = dec.args[0].s
-                                    else:
-                                        reason = dec.keywords[0].value.s
-                                    this_zest_skip_reason = reason
+                this_zest_groups, this_zest_skip_reason = _extract_groups_and_skip(
+                    part.decorator_list
+                )
 
                 # RECURSE
                 n_test_funcs += 1
@@ -182,10 +240,10 @@ def _recurse_ast(path, lineno, body, func_name=None, parent_name=None):
                     found_zest_call_before_final_func_def = True
 
         # Check for the call to "zest()"
-        if (
-            isinstance(part, ast.Expr)
-            and isinstance(part.value, ast.Call)
-            and isinstance(part.value.func, ast.Name)
+        elif (
+            part_type is _Expr
+            and type(part.value) is _Call
+            and type(part.value.func) is _Name
             and part.value.func.id == "zest"
         ):
             found_zest_call = True
@@ -219,9 +277,10 @@ def _flatten_found_zests(
     """
     ret_list = []
     for found_zest in found_zests_tree or []:
-        found_zest.name = (
-            parent_name + "." if parent_name is not None else ""
-        ) + found_zest.name
+        # Interned as every ancestor name is rebuilt for each of its descendants
+        found_zest.name = sys.intern(
+            (parent_name + "." if parent_name is not None else "") + found_zest.name
+        )
         _parent_groups = set(parent_groups) | set(found_zest.groups)
         found_zest.groups = list(_parent_groups)
         children = _flatten_found_zests(
@@ -234,6 +293,118 @@ def _flatten_found_zests(
     return ret_list
 
 
+# A root zest is a "def zest_..." at module level or in a module level "with"
+# block, so it is always at the start of a (possibly indented) line. The
+# plain substring test in front of it rejects most modules even faster.
+_root_zest_def_pat = re.compile(rb"^[ \t]*def[ \t]+zest_", re.MULTILINE)
+
+
+def _find_zests_in_module(path, source):
+    """
+    Parse the module source (bytes) and return the flattened list of FoundZest.
+    Raises SyntaxError if the module can not be parsed.
+    """
+    if b"zest_" not in source or not _root_zest_def_pat.search(source):
+        # Can not contain a root zest so skip the (much more expensive) parse
+        return []
+
+    # Same as ast.parse() minus its wrapper; the source stays as bytes so the
+    # compiler does the decode (honoring any coding cookie) itself.
+    module_ast = compile(source, path, "exec", flags=ast.PyCF_ONLY_AST, dont_inherit=True)
+
+    found_zests, errors = _recurse_ast(path, 0, module_ast.body)
+    assert len(errors) == 0
+    return _flatten_found_zests(found_zests, None, set())
+
+
+def _parse_module(path_and_source):
+    """
+    Pool-friendly wrapper around _find_zests_in_module.
+
+    Returns:
+        (list of FoundZest, None) or (None, lineno) on a SyntaxError
+    """
+    path, source = path_and_source
+    try:
+        return _find_zests_in_module(path, source), None
+    except SyntaxError as e:
+        return None, e.lineno
+
+
+# Below this many modules to parse the cost of starting a pool is not worth it
+_PARALLEL_PARSE_MIN_MODULES = 64
+
+_PARALLEL_PARSE_CHUNKSIZE = 8
+
+
+def _parse_modules(paths_and_sources):
+    """
+    Parse every (path, source) returning a list of _parse_module results in
+    the same order. Parsing is pure and CPU bound so a large batch (eg. a
+    cold cache) is fanned out across processes.
+    """
+    # No more workers than there are chunks to hand out
+    n_processes = min(
+        os.cpu_count() or 1,
+        math.ceil(len(paths_and_sources) / _PARALLEL_PARSE_CHUNKSIZE),
+    )
+    if len(paths_and_sources) < _PARALLEL_PARSE_MIN_MODULES or n_processes <= 1:
+        return [_parse_module(path_and_source) for path_and_source in paths_and_sources]
+
+    # Flushed first so the forked workers do not inherit pending output
+    sys.stdout.flush()
+    with multiprocessing.Pool(processes=n_processes) as pool:
+        return pool.map(
+            _parse_module, paths_and_sources, chunksize=_PARALLEL_PARSE_CHUNKSIZE
+        )
+
+
+# Bump the first element if the cached entry layout changes. The zest version
+# is included so that an upgrade with a changed discovery never reads stale
+# entries and the interpreter version as the parse of the same source may
+# differ between them.
+_AST_CACHE_VERSION = (3, __version__, sys.version_info[:2])
+
+
+def _ast_cache_path(root):
+    return os.path.join(root, ".zest_cache", "ast.pkl")
+
+
+def _ast_cache_load(root):
+    """
+    Load the discovery cache for this root.
+
+    Returns:
+        dict of module path -> (sha256 digest, list of FoundZest)
+
+    Any problem reading the cache is treated as an empty cache.
+    """
+    try:
+        with open(_ast_cache_path(root), "rb") as f:
+            version, ast_cache = pickle.load(f)
+        if version == _AST_CACHE_VERSION:
+            return ast_cache
+    except Exception:
+        pass
+    return {}
+
+
+def _ast_cache_save(root, ast_cache):
+    """
+    Write the cache atomically so concurrent runners never see a partial file.
+    Failures (eg. a read-only root) are ignored; the cache is only an optimization.
+    """
+    path = _ast_cache_path(root)
+    tmp_path = f"{path}.{os.getpid()}"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, "wb") as f:
+            pickle.dump((_AST_CACHE_VERSION, ast_cache), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
+
+
 def find_zests(
     root,
     include_dirs,
@@ -308,90 +479,142 @@ def find_zests(
 
     match_string_parts = match_string.split(".") if match_string is not None else []
 
-    for curr in _walk_include_dirs(root, include_dirs):
-        for _, module_name, _ in pkgutil.iter_modules(path=[curr]):
+    match_string_prefix = None
+    if match_string_parts and match_string_parts[0] != "":
+        match_string_prefix = match_string_parts[0].encode()
+
+    ast_cache = _ast_cache_load(root)
+    ast_cache_dirty = False
+
+    # Gather all the modules first so that the ones that are not in the
+    # cache can be parsed as one batch.
+    # Each module is (curr, module_name, path, cached found_zests or None, digest)
+    # where digest is what to cache a new parse under.
+    modules = []
+    to_parse = []
+    seen_paths = set()
+    for curr, module_names in _walk_include_dirs(root, include_dirs):
+        for module_name in module_names:
             if allow_files is not None:
                 if module_name not in allow_files:
                     continue
 
             path = os.path.join(curr, module_name + ".py")
 
-            # HACK!
-            # global debug_hack
-            # if path == "/erisyon/plaster/plaster/run/sigproc_v2/zests/zest_sigproc_v2_worker.py":
-            #     debug_hack = True
-            # else:
-            #     debug_hack = False
-            with open(path) as file:
+            # Parsing is by far the most expensive part of discovery so the
+            # results are cached for modules that are unchanged since last run.
+            # Unchanged is decided by content: an mtime and size can match
+            # after an edit (eg. a fast save, or a checkout that sets mtimes).
+            seen_paths.add(path)
+            with open(path, "rb") as file:
                 source = file.read()
 
-            try:
-                module_ast = ast.parse(source)
-            except SyntaxError as e:
-                # parent_name, path, lineno, error_message
-                errors_to_show += [("", curr + "/" + module_name, e.lineno, f"Syntax error in {module_name}")]
-                break
-
-            found_zests, errors = _recurse_ast(path, 0, module_ast.body)
-            assert len(errors) == 0
-            found_zests = _flatten_found_zests(found_zests, None, set())
-
-            for found_zest in found_zests:
-                full_name = found_zest.name
-                full_name_parts = full_name.split(".")
-                package = ".".join(curr.split(os.sep)[n_root_parts:])
-
-                allow = check_allow_to_run(allow_to_run, full_name_parts)
-                if allow:
-                    # If running all or the full_name matches or if the
-                    # match_string contains an ancestor match
-                    # Eg: match_string == "foo.bar" we have to match on
-                    # foo and foo.bar
-
-                    any_parent = all([
-                        match_string_parts[i] == full_name_parts[i]
-                        for i in range( min( len(match_string_parts), len(full_name_parts) ) )
-                    ])
-
-                    if match_string is None or match_string in full_name or any_parent:
-                        # So that you can terminate a match_string like "it_foobars."
-                        # we add an extra "." to the end pf full_name in this comparison
-                        if any([e in full_name + "." for e in exclude_strings]):
+            digest = hashlib.sha256(source).digest()
+            cached = ast_cache.get(path)
+            if cached is not None and cached[0] == digest:
+                modules += [(curr, module_name, path, cached[1], None)]
+                continue
+
+            if match_string_prefix is not None and match_string_prefix not in source:
+                # Every match must contain the first part of match_string
+                # somewhere in a function name so this module can not match.
+                # Not cached as this depends on match_string.
+                continue
+
+            modules += [(curr, module_name, path, None, digest)]
+            to_parse += [(path, source)]
+
+    parsed = iter(_parse_modules(to_parse))
+
+    syntax_error_curr = None
+    for curr, module_name, path, found_zests, digest in modules:
+        if found_zests is None:
+            found_zests, syntax_error_lineno = next(parsed)
+            if found_zests is not None:
+                ast_cache[path] = (digest, found_zests)
+                ast_cache_dirty = True
+
+        if curr == syntax_error_curr:
+            # The rest of a folder is ignored after a syntax error
+            continue
+
+        if found_zests is None:
+            # parent_name, path, lineno, error_message
+            errors_to_show += [("", curr + "/" + module_name, syntax_error_lineno, f"Syntax error in {module_name}")]
+            syntax_error_curr = curr
+            continue
+
+        package = ".".join(curr.split(os.sep)[n_root_parts:])
+
+        for found_zest in found_zests:
+            full_name = found_zest.name
+            full_name_parts = full_name.split(".")
+
+            allow = check_allow_to_run(allow_to_run, full_name_parts)
+            if allow:
+                # If running all or the full_name matches or if the
+                # match_string contains an ancestor match
+                # Eg: match_string == "foo.bar" we have to match on
+                # foo and foo.bar
+
+                any_parent = all([
+                    match_string_parts[i] == full_name_parts[i]
+                    for i in range( min( len(match_string_parts), len(full_name_parts) ) )
+                ])
+
+                if match_string is None or match_string in full_name or any_parent:
+                    # So that you can terminate a match_string like "it_foobars."
+                    # we add an extra "." to the end pf full_name in this comparison
+                    if any([e in full_name + "." for e in exclude_strings]):
+                        continue
+
+                    # IGNORE skips
+                    if found_zest.skip is not None:
+                        # possible skip unless bypassed
+                        if bypass_skip is None or bypass_skip != full_name:
+                            continue
+
+                    # IGNORE groups not in the groups list or in exclude_groups
+                    if found_zest.groups is not None:
+                        # If CLI groups is specified and there there is no
+                        # group in common between the CLI groups and the
+                        # groups of this test then skip it.
+                        if groups is not None and not set.intersection(
+                            set(found_zest.groups), groups
+                        ):
+                            continue
+
+                        # If CLI exclude_groups is specified and there there *is*
+                        # a group in common between then skip it.
+                        if exclude_groups is not None and set.intersection(
+                            set(found_zest.groups), exclude_groups
+                        ):
                             continue
 
-                        # IGNORE skips
-                        if found_zest.skip is not None:
-                            # possible skip unless bypassed
-                            if bypass_skip is None or bypass_skip != full_name:
-                                continue
-
-                        # IGNORE groups not in the groups list or in exclude_groups
-                        if found_zest.groups is not None:
-                            # If CLI groups is specified and there there is no
-                            # group in common between the CLI groups and the
-                            # groups of this test then skip it.
-                            if groups is not None and not set.intersection(
-                                set(found_zest.groups), groups
-                            ):
-                                continue
-
-                            # If CLI exclude_groups is specified and there there *is*
-                            # a group in common between then skip it.
-                            if exclude_groups is not None and set.intersection(
-                                set(found_zest.groups), exclude_groups
-                            ):
-                                continue
-
-                        # FIND any errors from this zest:
-                        for error in found_zest.errors:
-                            errors_to_show += [error]
-
-                        # Include this and all ancestors in the list
-                        for i in range(len(full_name_parts)):
-                            name = ".".join(full_name_parts[0 : i + 1])
-                            return_allow_to_run.update({name})
-
-                        root_zest_funcs[full_name_parts[0]] = (module_name, package, path)
+                    # FIND any errors from this zest:
+                    for error in found_zest.errors:
+                        errors_to_show += [error]
+
+                    # Include this and all ancestors in the set. Working up from
+                    # the leaf, once an ancestor is already present so are all of
+                    # its own ancestors.
+                    for i in range(len(full_name_parts), 0, -1):
+                        name = sys.intern(".".join(full_name_parts[0:i]))
+                        if name in return_allow_to_run:
+                            break
+                        return_allow_to_run.add(name)
+
+                    root_zest_funcs[full_name_parts[0]] = (module_name, package, path)
+
+    # Forget modules that have been deleted. Paths that were merely outside
+    # of this run's include_dirs / allow_files are kept.
+    for path in [path for path in ast_cache if path not in seen_paths]:
+        if not os.path.exists(path):
+            del ast_cache[path]
+            ast_cache_dirty = True
+
+    if ast_cache_dirty:
+        _ast_cache_save(root, ast_cache)
 
     return root_zest_funcs, return_allow_to_run, errors_to_show
 
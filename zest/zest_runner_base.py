@@ -1,6 +1,5 @@
 import glob
 import time
-import json
 import os
 import re
 import io
@@ -11,11 +10,10 @@ import multiprocessing
 import traceback
 import pathlib
 from contextlib import contextmanager
-from zest.zest import ZestResult
+from zest.zest import ZestResult, _zest_result_len
 from multiprocessing import Queue
 from queue import Empty
 from collections import deque
-from pathlib import Path
 from zest import zest
 from zest.zest import log
 from zest import zest_finder
@@ -24,26 +22,78 @@ from zest import zest_display
 
 @contextmanager
 def open_event_stream(output_folder, root_name):
-    f = None
+    """
+    Yields a raw fd so that each emit is a single write(2) with no
+    Python io layer or flush in between.
+    """
+    fd = None
     try:
-        f = open(f"{output_folder}/{root_name}.evt", "a+b", buffering=0)
-        yield f
+        fd = os.open(
+            f"{output_folder}/{root_name}.evt",
+            os.O_WRONLY | os.O_CREAT | os.O_APPEND | getattr(os, "O_BINARY", 0),
+            0o644,
+        )
+        yield fd
     finally:
-        if f is not None:
-            f.close()
+        if fd is not None:
+            os.close(fd)
 
 
 def emit_zest_result(zest_result, stream):
     assert isinstance(zest_result, ZestResult)
-    msg = (zest_result.dumps() + "\n").encode()
-    stream.write(msg)
-    stream.flush()
+    data = memoryview(zest_result.dumps_fast())
+    while len(data) > 0:
+        data = data[os.write(stream, data):]
+
+
+def read_zest_result_line(fd):
+    """
+    Yield the ZestResults of an event stream written by emit_zest_result().
+    The stream is read in one call and the records are sliced out of it.
+    A truncated record means one cut off by a killed worker (or a stream
+    from an older format); whatever follows it is ignored.
+    """
+    data = memoryview(fd.read())
+    len_size = _zest_result_len.size
+    unpack_len_from = _zest_result_len.unpack_from
+    end = len(data)
+    i = 0
+    while i + len_size <= end:
+        (n,) = unpack_len_from(data, i)
+        i += len_size
+        if i + n > end:
+            break
+
+        yield ZestResult.loads_fast(data[i : i + n])
+        i += n
 
 
 class ZestRunnerBase:
+    # The runner attributes are read on every test callback; slots avoid
+    # the instance __dict__ lookups. Subclasses list their own additions.
+    __slots__ = (
+        "callback",
+        "output_folder",
+        "n_run",
+        "capture",
+        "results",
+        "retcode",
+        "verbose",
+        "add_markers",
+        "allow_to_run",
+        "disable_shuffle",
+        "bypass_skip",
+        "groups",
+        "exclude_groups",
+        "common_tmp",
+        "tmp_root",
+        "root",
+        "root_zests",
+    )
+
     def __init__(
         self,
-        output_folder=Path(".zest_results"),
+        output_folder=".zest_results",
         callback=None,
         root=None,
         include_dirs=None,
@@ -120,7 +170,7 @@ class ZestRunnerBase:
         self.verbose = verbose
         self.add_markers = add_markers
         self.allow_to_run = allow_to_run
-        self.output_folder.mkdir(parents=True, exist_ok=True)
+        os.makedirs(self.output_folder, exist_ok=True)
         self.disable_shuffle = disable_shuffle
         self.bypass_skip = bypass_skip
         self.groups = groups
@@ -185,11 +235,10 @@ class ZestRunnerBase:
     def load_previous(self):
         fails = {}
         for file in glob.glob(str(self.output_folder / "*")):
-            with open(file) as f:
-                for line in f:
-                    res = json.loads(line)
+            with open(file, "rb") as f:
+                for res in read_zest_result_line(f):
                     # There can be multiple records from previous runs,
                     # accept the LASt state of the error run
-                    fails[res.get("full_name")] = True if res.get("error") is not None else False
+                    fails[res.full_name] = res.error is not None
         return list(set([key for key, val in fails.items() if val]))
 
@@ -11,15 +11,14 @@ import multiprocessing
 import multiprocessing.pool
 import traceback
 import pathlib
-from multiprocessing import Queue
-from queue import Empty
+from multiprocessing import SimpleQueue
 from collections import deque
 from pathlib import Path
 from zest import zest
 from zest.zest import ZestResult
 from zest.zest_runner_base import ZestRunnerBase, emit_zest_result, open_event_stream
 from zest import zest_finder
-from zest.zest import log
+from zest.zest import log, flush_log
 from subprocess import Popen, DEVNULL
 from dataclasses import dataclass
 from contextlib import redirect_stdout, redirect_stderr
@@ -33,6 +32,8 @@ from zest.zest_display import (
     display_stop,
     display_error,
     error_header,
+    write_raw,
+    batch,
 )
 
 # Nondaemonic
@@ -57,18 +58,6 @@ class NestablePool(multiprocessing.pool.Pool):
         super(NestablePool, self).__init__(*args, **kwargs)
 
 
-def read_zest_result_line(fd):
-    while True:
-        line = fd.readline()
-        if not line:
-            break
-
-        if not isinstance(line, str):
-            line = line.decode()
-
-        yield ZestResult.loads(line)
-
-
 def clear_output_folder(output_folder):
     """
     Delete all results in the output folder
@@ -97,19 +86,22 @@ def _do_work_order(
     zest._bubble_exceptions = False
     zest.reset(disable_shuffle, bypass_skip)
 
-    with open_event_stream(output_folder, root_name) as event_stream:
-        # It may be very slow to have the load_module here in the child
-        # processes as it means that each child will have to load_module
-        # and get no benefit from caching of modules. It might be better
-        # to move this in to the parent process
+    # Bound once here as event_callback runs on every sub-zest start and stop
+    emit = emit_zest_result
+    queue_put = _do_work_order.queue.put
+    monotonic = time.monotonic
+    should_put = _StartCoalescer().should_put
 
+    with open_event_stream(output_folder, root_name) as event_stream:
         def event_callback(zest_result):
             """
             This callback occurs anytime a sub-zest starts or stops.
             """
-            emit_zest_result(zest_result, event_stream)
-            _do_work_order.queue.put(zest_result)
             nonlocal zest_result_to_return
+            emit(zest_result, event_stream)
+            # The event stream gets every event, the parent only what it shows
+            if should_put(zest_result.is_running, monotonic()):
+                queue_put(zest_result)
             zest_result_to_return = zest_result
 
         try:
@@ -123,22 +115,106 @@ def _do_work_order(
                 test_stop_callback=event_callback,
                 allow_to_run=allow_to_run,
             )
-        except Exception as e:
-            e._formatted = traceback.format_exception(
-                etype=type(e), value=e, tb=e.__traceback__
+        except (Exception, SystemExit) as e:
+            if isinstance(e, SystemExit):
+                # Raised as is in the parent it would quietly end the run
+                e = RuntimeError(f"SystemExit({e.code}) raised").with_traceback(e.__traceback__)
+            # Only the frames are sent; the parent formats them if the error
+            # is shown. Their source lines are looked up at that point too.
+            e._tb_frames = traceback.StackSummary.extract(
+                traceback.walk_tb(e.__traceback__), lookup_lines=False
             )
             e._root_name = root_name
             _do_work_order.queue.put(e)
 
+    # Pool workers end with os._exit which skips the atexit flush of the log
+    flush_log()
     return zest_result_to_return
 
 
+# Upper bound on how often message_pump redraws the worker status block
+_MAX_STATUS_FPS = 30
+
+# Nested starts within this long of a sent start are not sent to the parent
+_COALESCE_STARTS_S = 0.05
+
+
+class _StartCoalescer:
+    """
+    Decides which of a work order's events are sent to the parent.
+    A start that quickly follows another sent start is nested inside it,
+    so the parent can keep showing the outer one. Stops are always sent.
+    """
+
+    __slots__ = ("last_put_was_running", "last_put_at")
+
+    def __init__(self):
+        self.last_put_was_running = False
+        self.last_put_at = 0.0
+
+    def should_put(self, is_running, now):
+        if (
+            is_running
+            and self.last_put_was_running
+            and now - self.last_put_at < _COALESCE_STARTS_S
+        ):
+            return False
+        self.last_put_was_running = is_running
+        self.last_put_at = now
+        return True
+
+
 def _do_worker_init(queue):
     _do_work_order.queue = queue
 
 
+# Wall time of each root zest on its last run, kept in the output folder
+_ROOT_TIMES_FILE = ".zest_times.json"
+
+
+def _load_root_times(output_folder):
+    try:
+        with open(Path(output_folder) / _ROOT_TIMES_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_root_times(output_folder, root_times):
+    try:
+        with open(Path(output_folder) / _ROOT_TIMES_FILE, "w") as f:
+            json.dump(root_times, f)
+    except OSError:
+        pass
+
+
+def _longest_first(work_orders, root_times):
+    """
+    Sort work orders (root_name first) by the last run time of their root,
+    longest first. Roots with no recorded time go ahead of all of them.
+    """
+    return sorted(work_orders, key=lambda order: -root_times.get(order[0], float("inf")))
+
+
 class ZestRunnerMultiThread(ZestRunnerBase):
-    state_messages = ["DONE", "RUNNING"]
+    __slots__ = (
+        "n_workers",
+        "allow_output",
+        "queue",
+        "pool",
+        "map_results",
+        "worker_status",
+        "pid_to_worker_i",
+        "run_complete",
+        "n_errors",
+        "n_successes",
+        "n_skips",
+        "n_events",
+        "_status_lines",
+        "_status_row_keys",
+        "_status_rows",
+        "root_times",
+    )
 
     def n_live_procs(self):
         return len([proc for proc in self.procs if proc.exit_code is None])
@@ -155,9 +231,22 @@ class ZestRunnerMultiThread(ZestRunnerBase):
                     except ProcessLookupError:
                         log(f"KILL failed {proc.pid}")
 
-    def poll(self, request_stop):
+    def _wake(self, _):
+        """
+        Called by the pool's result handler thread when all work orders are
+        complete. Puts a sentinel on the queue so that a poll() blocked in
+        queue.get() wakes immediately instead of waiting out its timeout.
+        """
+        self.queue.put(None)
+
+    def poll(self, request_stop, timeout=None):
         """
         Check the status of all running threads
+
+        timeout:
+            If not None, block up to this many seconds waiting for the first
+            event from the workers. Otherwise return immediately.
+
         Returns:
             True if there's more to do
             False if everything is done
@@ -176,42 +265,56 @@ class ZestRunnerMultiThread(ZestRunnerBase):
             self.pool.join()
             return False
 
-        try:
-            while True:
-                zest_result = self.queue.get_nowait()
-
-                if isinstance(zest_result, Exception):
-                    raise zest_result
-                assert isinstance(zest_result, ZestResult)
-
-                # The child only knows its pid but we need to know which pool
-                # process that pid maps to. The pids change as the multiprocess
-                # pool logic may kill off child processes and re-use others.
-                # So here we monitor the self.pool._pool which is a list
-                # of Process objects that contain the pids
-                for i, p in enumerate(self.pool._pool):
-                    self.pid_to_worker_i[p.pid] = i
-
-                worker_i = self.pid_to_worker_i.get(zest_result.pid)
-                if worker_i is not None:
-                    zest_result.worker_i = self.pid_to_worker_i[zest_result.pid]
-                # else:
-                #     log("Unknown zest_result.worker_i", zest_result.pid, self.pid_to_worker_i)
-                self.worker_status[zest_result.worker_i] = zest_result
-                if not zest_result.is_running and not zest_result.is_starting:
-                    self.results += [zest_result]
-
-                    if zest_result.skip is not None:
-                        self.n_skips += 1
-                    elif zest_result.error is not None:
-                        self.n_errors += 1
-                    else:
-                        self.n_successes += 1
+        # Drain everything that is waiting in one go, then process the batch.
+        # SimpleQueue.get() has no timeout so wait on its pipe instead.
+        batch = []
+        ready = self.queue._reader.poll
+        if ready(timeout or 0.0):
+            batch.append(self.queue.get())
+            while ready():
+                batch.append(self.queue.get())
+
+        if batch:
+            # The child only knows its pid but we need to know which pool
+            # process that pid maps to. The pids change as the multiprocess
+            # pool logic may kill off child processes and re-use others.
+            # So here we monitor the self.pool._pool which is a list
+            # of Process objects that contain the pids
+            for i, p in enumerate(self.pool._pool):
+                self.pid_to_worker_i[p.pid] = i
+
+        for zest_result in batch:
+            if zest_result is None:
+                # Wake-up sentinel from _wake(). The pool calls back just
+                # before it marks map_results ready so wait for that flag.
+                self.map_results.wait()
+                continue
+
+            if isinstance(zest_result, Exception):
+                raise zest_result
+            assert isinstance(zest_result, ZestResult)
+            self.n_events += 1
+
+            worker_i = self.pid_to_worker_i.get(zest_result.pid)
+            if worker_i is not None:
+                zest_result.worker_i = worker_i
+            # else:
+            #     log("Unknown zest_result.worker_i", zest_result.pid, self.pid_to_worker_i)
+            self.worker_status[zest_result.worker_i] = zest_result
+            if not zest_result.is_running and not zest_result.is_starting:
+                self.results.append(zest_result)
+                if zest_result.full_name in self.root_zests and zest_result.elapsed is not None:
+                    self.root_times[zest_result.full_name] = zest_result.elapsed
+
+                if zest_result.skip is not None:
+                    self.n_skips += 1
+                elif zest_result.error is not None:
+                    self.n_errors += 1
+                else:
+                    self.n_successes += 1
 
-                if self.callback is not None:
-                    self.callback(zest_result)
-        except Empty:
-            pass
+            if self.callback is not None:
+                self.callback(zest_result)
 
         if (
             self.map_results is not None
@@ -219,6 +322,7 @@ class ZestRunnerMultiThread(ZestRunnerBase):
             and self.queue.empty()
         ):
             self.pool.join()
+            _save_root_times(self.output_folder, self.root_times)
             return False
 
         return True
@@ -230,34 +334,54 @@ class ZestRunnerMultiThread(ZestRunnerBase):
         Return the cursor to the start line
         """
 
+        # The whole frame is accumulated and emitted with a single write
+        buf = []
+
+        # Fixed at construction so there's no need to re-measure worker_status
+        n_workers = self.n_workers
+
         def cursor_move_up(n_lines):
-            sys.stdout.write(f"\033[{n_lines}A")
+            buf.append(f"\033[{n_lines}A")
 
         def cursor_clear_to_eol_and_newline():
-            sys.stdout.write("\033[K\n")
-
-        def write_line(line):
+            buf.append("\033[K\n")
+
+        def write_line(line_i, line):
+            if line == self._status_lines[line_i]:
+                # Unchanged since the last frame, just step over it
+                buf.append("\n")
+                return
+            self._status_lines[line_i] = line
             if len(line) > 0:
                 assert line[-1] != "\n"
-                sys.stdout.write(line)
+                buf.append(line)
             cursor_clear_to_eol_and_newline()
 
         for i, worker in enumerate(self.worker_status):
             if self.run_complete:
-                write_line("")
+                write_line(i, "")
             else:
                 if worker is not None:
-                    write_line(
-                        f"{i:2d}: {self.state_messages[worker.is_running]:<8s} {worker.full_name}"
-                    )
+                    # Only re-format a row when its worker's state changed
+                    key = (worker.is_running, worker.full_name)
+                    if key != self._status_row_keys[i]:
+                        self._status_row_keys[i] = key
+                        self._status_rows[i] = (
+                            f"{i:2d}: {('RUNNING' if worker.is_running else 'DONE'):<8s} {worker.full_name}"
+                        )
+                    write_line(i, self._status_rows[i])
                 else:
-                    write_line(f"{i:2d}: NOT STARTED")
+                    write_line(i, f"{i:2d}: NOT STARTED")
         write_line(
-            f"{colors.green}{self.n_successes} {colors.red}{self.n_errors} {colors.yellow}{self.n_skips} {colors.reset}"
+            n_workers,
+            f"{colors.green}{self.n_successes} {colors.red}{self.n_errors} {colors.yellow}{self.n_skips} {colors.reset}",
         )
 
-        cursor_move_up(len(self.worker_status) + 1)
+        cursor_move_up(n_workers + 1)
+
+        write_raw("".join(buf))
 
+    @batch()
     def draw_complete(self):
         display_complete("", self.results)
 
@@ -275,18 +399,42 @@ class ZestRunnerMultiThread(ZestRunnerBase):
             # CHECK that zest_find did not fail
             return self
 
+        # The live status block is all cursor movement; when stdout is a
+        # file or pipe (eg. CI) it is noise so only the final report is shown.
+        show_status = self.allow_output and sys.stdout.isatty()
+
         request_stop = False
-        last_draw = 0.0
+        drawn_n_events = None
+        drawn_at = 0.0
+        n_quiet_polls = 0
         while True:
             try:
                 # if  request_stop = True
                 #   TODO
 
-                if self.allow_output and time.time() - last_draw > 0.5:
-                    self.draw_status()
-                    last_draw = time.time()
+                # Any worker event wakes the poll immediately. While nothing
+                # is changing the backstop timeout backs off 10 ms -> 200 ms.
+                timeout = min(0.2, 0.01 * 2 ** min(n_quiet_polls, 5))
+
+                if self.n_events != drawn_n_events:
+                    n_quiet_polls = 0
+                    timeout = 0.01
+                    if show_status:
+                        # Redraws are capped at _MAX_STATUS_FPS; a frame that
+                        # comes too soon waits for the next poll.
+                        wait = drawn_at + 1.0 / _MAX_STATUS_FPS - time.monotonic()
+                        if wait > 0.0:
+                            timeout = wait
+                        else:
+                            self.draw_status()
+                            drawn_at = time.monotonic()
+                            drawn_n_events = self.n_events
+                    else:
+                        drawn_n_events = self.n_events
+                else:
+                    n_quiet_polls += 1
 
-                if not self.poll(request_stop):
+                if not self.poll(request_stop, timeout=timeout):
                     self.retcode = self.n_errors
                     self.run_complete = True
                     break
@@ -295,8 +443,9 @@ class ZestRunnerMultiThread(ZestRunnerBase):
                 request_stop = True
                 self.retcode = 1
 
-        if self.allow_output:
+        if show_status:
             self.draw_status()
+        if self.allow_output:
             self.draw_complete()
 
     def __init__(self, n_workers=2, allow_output=True, **kwargs):
@@ -309,14 +458,22 @@ class ZestRunnerMultiThread(ZestRunnerBase):
         self.n_workers = n_workers
         self.pid_to_worker_i = {}
         self.worker_status = [None] * self.n_workers
+        # What draw_status last put on each line (workers + summary line)
+        self._status_lines = [None] * (self.n_workers + 1)
+        # Formatted worker rows memoized by (is_running, full_name)
+        self._status_row_keys = [None] * self.n_workers
+        self._status_rows = [""] * self.n_workers
         self.pool = None
-        self.queue = Queue()
+        # The workers put straight into the pipe: no feeder thread per worker
+        self.queue = SimpleQueue()
         self.map_results = None
         self.allow_output = allow_output
         self.run_complete = False
         self.n_errors = 0
         self.n_successes = 0
         self.n_skips = 0
+        self.n_events = 0
+        self.root_times = _load_root_times(self.output_folder)
 
         work_orders = []
         for (root_name, (module_name, package, full_path),) in self.root_zests.items():
@@ -333,11 +490,23 @@ class ZestRunnerMultiThread(ZestRunnerBase):
                 )
             ]
 
+        # Longest first and one order per dispatch so that the stragglers
+        # don't end up at the tail
+        work_orders = _longest_first(work_orders, self.root_times)
+
         if self.is_unlimited_run():
             # Clear evt caches
             clear_output_folder(self.output_folder)
 
-        # multiprocessing.Queue can only be passed via the pool initializer, not as an arg.
+        # The queue can only be passed via the pool initializer, not as an arg.
+        # Flushed first so the forked workers do not inherit pending output.
+        sys.stdout.flush()
         self.pool = NestablePool(self.n_workers, _do_worker_init, [self.queue])
-        self.map_results = self.pool.starmap_async(_do_work_order, work_orders)
+        self.map_results = self.pool.starmap_async(
+            _do_work_order,
+            work_orders,
+            chunksize=1,
+            callback=self._wake,
+            error_callback=self._wake,
+        )
         self.pool.close()
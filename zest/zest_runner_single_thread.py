@@ -26,6 +26,8 @@ from zest.zest_display import (
 
 
 class ZestRunnerSingleThread(ZestRunnerBase):
+    __slots__ = ()
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
 
@@ -51,7 +53,7 @@ class ZestRunnerSingleThread(ZestRunnerBase):
         def event_test_stop(zest_result):
             nonlocal last_depth, curr_depth
             emit_zest_result(zest_result, event_stream)
-            self.results += [zest_result]
+            self.results.append(zest_result)
             curr_depth = len(zest_result.call_stack) - 1
             if self.verbose >= 2:
                 display_stop(
@@ -6,9 +6,17 @@ to test single and multi-runner models.
 import time
 import re
 import os
+import sys
+import json
+import pickle
+import shutil
+import tempfile
 from contextlib import contextmanager
 from zest import zest, TrappedException
-from zest.zest import log, strip_ansi
+from zest.zest import log, strip_ansi, ZestResult
+from zest import zest_finder
+from zest.zest_runner_base import emit_zest_result, open_event_stream, read_zest_result_line
+from zest.zest_runner_multi_thread import _longest_first, _StartCoalescer, _COALESCE_STARTS_S
 import pretend_unit_under_test
 from zest.version import __version__
 import subprocess
@@ -17,6 +25,20 @@ import subprocess
 startup_folder = os.getcwd()
 
 
+@contextmanager
+def _tmp_zests_root(**sources_by_module_name):
+    """A throwaway root holding a zests/ folder with the given modules"""
+    root = tempfile.mkdtemp()
+    try:
+        os.mkdir(os.path.join(root, "zests"))
+        for module_name, source in sources_by_module_name.items():
+            with open(os.path.join(root, "zests", module_name + ".py"), "w") as f:
+                f.write(source)
+        yield root
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
 def zest_runner_single_thread():
     """Test all options under single threaded models"""
 
@@ -167,6 +189,82 @@ def zest_runner_single_thread():
         )
         assert "exception" not in output
 
+    def it_writes_run_in_subprocess_output_once():
+        # Through a pipe (without -u) stdout is block buffered and the fork
+        # must not leave the child a copy of what is still pending
+        ret_code, output = _call_zest_cli(
+            "--verbose=2", "--bypass_skip=zest_runs_in_subprocess", "zest_runs_in_subprocess"
+        )
+        assert ret_code == 0
+        assert strip_ansi(output).count("+zest_runs_in_subprocess:") == 1
+        assert output.count("from the subprocess") == 1
+
+    def it_treats_sys_exit_0_in_a_subprocess_as_success():
+        ret_code, output = _call_zest_cli(
+            "--verbose=2", "--bypass_skip=zest_exits_zero_in_subprocess", "zest_exits_zero_in_subprocess"
+        )
+        assert ret_code == 0
+        assert "died unexpectedly" not in output
+
+    def it_caches_discovery():
+        def _write_probe(root, it_name, module_name="zest_cache_probe"):
+            path = os.path.join(root, "zests", module_name + ".py")
+            with open(path, "w") as f:
+                f.write(f"from zest import zest\n\ndef {module_name}():\n    def {it_name}():\n        pass\n\n    zest()\n")
+            return path
+
+        def _run_probe(root, allow_files="zest_cache_probe"):
+            ret_code, output = _call_zest_cli("--verbose=2", f"--root={root}", f"--allow_files={allow_files}")
+            assert ret_code == 0
+            return _get_run_tests(output)
+
+        def it_reparses_an_edited_module():
+            with _tmp_zests_root() as root:
+                _write_probe(root, "it_one")
+                assert "it_one" in _run_probe(root)
+                _write_probe(root, "it_two_longer")
+                found_tests = _run_probe(root)
+                assert "it_two_longer" in found_tests and "it_one" not in found_tests
+
+        def it_compares_content_when_mtime_and_size_match():
+            with _tmp_zests_root() as root:
+                path = _write_probe(root, "it_aaa")
+                assert "it_aaa" in _run_probe(root)
+                st = os.stat(path)
+                _write_probe(root, "it_bbb")
+                os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+                assert os.stat(path).st_size == st.st_size
+                found_tests = _run_probe(root)
+                assert "it_bbb" in found_tests and "it_aaa" not in found_tests
+
+        def it_prunes_deleted_modules():
+            with _tmp_zests_root() as root:
+                _write_probe(root, "it_stays")
+                gone_path = _write_probe(root, "it_goes", "zest_cache_gone")
+                _run_probe(root, "zest_cache_probe:zest_cache_gone")
+                assert gone_path in zest_finder._ast_cache_load(root)
+                os.unlink(gone_path)
+                _run_probe(root, "zest_cache_probe:zest_cache_gone")
+                assert gone_path not in zest_finder._ast_cache_load(root)
+
+        def it_ignores_a_corrupt_cache():
+            with _tmp_zests_root() as root:
+                _write_probe(root, "it_survives")
+                _run_probe(root)
+                with open(zest_finder._ast_cache_path(root), "wb") as f:
+                    f.write(b"not a pickle")
+                assert "it_survives" in _run_probe(root)
+
+        def it_ignores_a_cache_of_another_version():
+            with _tmp_zests_root() as root:
+                path = _write_probe(root, "it_survives")
+                os.mkdir(os.path.join(root, ".zest_cache"))
+                with open(zest_finder._ast_cache_path(root), "wb") as f:
+                    pickle.dump(((0,), {path: (b"", [])}), f)
+                assert "it_survives" in _run_probe(root)
+
+        zest()
+
     def it_uses_a_different_tmp_folder_per_test_by_default():
         ret_code, output = _call_zest_cli(
             "--verbose=2", "--bypass_skip=zest_tmp_folder_per_test", "zest_tmp_folder_per_test"
@@ -344,6 +442,112 @@ def zest_runner_multi_thread():
         assert "To stderr" in output
         assert ret_code == 0
 
+    def it_reruns_only_the_failed_from_the_event_streams():
+        source = (
+            "from zest import zest\n\n"
+            "def zest_rerun_probe():\n"
+            "    def it_passes():\n        pass\n\n"
+            "    def it_fails():\n        raise ValueError\n\n"
+            "    zest()\n"
+        )
+        with _tmp_zests_root(zest_rerun_probe=source) as root:
+            args = (
+                "--verbose=2",
+                f"--root={root}",
+                "--allow_files=zest_rerun_probe",
+                f"--output_folder={root}/.zest_results",
+            )
+            ret_code, output = _call_zest_cli(*args)
+            assert ret_code == 1
+            assert set(_get_run_tests(output)) == {"zest_rerun_probe", "it_passes", "it_fails"}
+
+            ret_code, output = _call_zest_cli(*args, "--allow_to_run=__failed__")
+            assert ret_code == 1
+            assert set(_get_run_tests(output)) == {"zest_rerun_probe", "it_fails"}
+
+    def it_gives_each_root_of_a_module_fresh_globals():
+        source = "seen = []\n" + "".join(
+            f"\ndef zest_globals_{i}():\n    seen.append({i})\n    assert seen == [{i}]\n"
+            for i in range(4)
+        )
+        with _tmp_zests_root(zest_globals_probe=source) as root:
+            ret_code, output = _call_zest_cli(
+                "--verbose=2", f"--root={root}", "--allow_files=zest_globals_probe"
+            )
+            assert ret_code == 0
+            assert len(_get_run_tests(output)) == 4
+
+    def it_records_root_times_for_the_next_run():
+        with _tmp_zests_root(
+            zest_fast_probe="def zest_fast_probe():\n    pass\n",
+            zest_slow_probe="import time\n\ndef zest_slow_probe():\n    time.sleep(0.2)\n",
+        ) as root:
+            ret_code, _ = _call_zest_cli(
+                f"--root={root}",
+                "--allow_files=zest_fast_probe:zest_slow_probe",
+                f"--output_folder={root}/.zest_results",
+            )
+            assert ret_code == 0
+            with open(f"{root}/.zest_results/.zest_times.json") as f:
+                root_times = json.load(f)
+            assert set(root_times.keys()) == {"zest_fast_probe", "zest_slow_probe"}
+            assert root_times["zest_slow_probe"] > root_times["zest_fast_probe"]
+
+    def it_dispatches_the_longest_roots_first():
+        work_orders = [("zest_short",), ("zest_new",), ("zest_long",), ("zest_mid",)]
+        root_times = dict(zest_short=0.1, zest_long=3.0, zest_mid=1.0)
+        ordered = _longest_first(work_orders, root_times)
+        assert [order[0] for order in ordered] == ["zest_new", "zest_long", "zest_mid", "zest_short"]
+
+    def it_coalesces_starts_by_when_they_follow_a_sent_start():
+        # (is_running, now) events fed in with the clock given explicitly
+        window = _COALESCE_STARTS_S
+        should_put = _StartCoalescer().should_put
+        assert should_put(True, 10.0)
+        assert not should_put(True, 10.0 + window / 2)
+        assert should_put(True, 10.0 + window * 2)
+        assert should_put(False, 10.0 + window * 2)
+        assert should_put(True, 10.0 + window * 2)
+        assert should_put(False, 10.0 + window * 2)
+        assert should_put(False, 10.0 + window * 2)
+
+    def it_streams_every_event_but_sends_only_the_outer_start():
+        source = (
+            "from zest import zest\n\n"
+            "def zest_nested_probe():\n"
+            "    def it_outer():\n"
+            "        def it_inner():\n            pass\n\n"
+            "        zest()\n\n"
+            "    zest()\n"
+        )
+        # A work order run in a fresh interpreter with a list standing in
+        # for the result queue and a window that no nested start can miss;
+        # prints (starts, stops) sent then streamed
+        script = (
+            "import sys, types\n"
+            "from zest import zest_runner_multi_thread\n"
+            "from zest.zest_runner_multi_thread import _do_work_order\n"
+            "zest_runner_multi_thread._COALESCE_STARTS_S = float('inf')\n"
+            "from zest.zest_runner_base import read_zest_result_line\n"
+            "root = sys.argv[1]\n"
+            "sent = []\n"
+            "_do_work_order.queue = types.SimpleNamespace(put=sent.append)\n"
+            "_do_work_order('zest_nested_probe', 'zest_nested_probe', root + '/zests/zest_nested_probe.py', root, False, None, True, '')\n"
+            "with open(root + '/zest_nested_probe.evt', 'rb') as f:\n"
+            "    streamed = list(read_zest_result_line(f))\n"
+            "for results in (sent, streamed):\n"
+            "    print(sum(r.is_running for r in results), sum(not r.is_running and not r.is_starting for r in results))\n"
+        )
+        with _tmp_zests_root(zest_nested_probe=source) as root:
+            output = subprocess.check_output(
+                [sys.executable, "-c", script, root], cwd=startup_folder
+            )
+        (sent_starts, sent_stops), (streamed_starts, streamed_stops) = [
+            [int(count) for count in line.split()] for line in output.decode().strip().split("\n")
+        ]
+        assert streamed_starts == 3 and streamed_stops == 3
+        assert sent_starts == 1 and sent_stops == 3
+
     def it_handles_hard_exit_of_child_process():
         it_ran = False
         ret_code = None
@@ -363,3 +567,146 @@ def zest_runner_multi_thread():
 
 
     zest()
+
+
+def zest_event_streams():
+    folder = None
+
+    def _before():
+        nonlocal folder
+        folder = tempfile.mkdtemp()
+
+    def _after():
+        shutil.rmtree(folder, ignore_errors=True)
+
+    def _result(name, **kwargs):
+        return ZestResult(call_stack=[name], full_name=name, short_name=name, **kwargs)
+
+    def _emit(*zest_results):
+        with open_event_stream(folder, "zest_probe") as stream:
+            for zest_result in zest_results:
+                emit_zest_result(zest_result, stream)
+        return os.path.join(folder, "zest_probe.evt")
+
+    def _read(path):
+        with open(path, "rb") as f:
+            return list(read_zest_result_line(f))
+
+    def it_round_trips_every_field():
+        zest_result = ZestResult(
+            call_stack=["zest_a", "it_b"],
+            full_name="zest_a.it_b",
+            short_name="it_b",
+            error='ValueError: "boom"',
+            error_formatted=["Traceback (most recent call last):\n", "ValueError: boom\n"],
+            elapsed=0.5,
+            stdout="out",
+            stderr="err",
+            logs="logs",
+            source="source",
+            pid=1234,
+            worker_i=1,
+        )
+        assert ZestResult.loads_fast(zest_result.dumps_fast()[4:]) == zest_result
+        assert _read(_emit(zest_result, _result("zest_c"))) == [zest_result, _result("zest_c")]
+
+    def it_stops_at_a_truncated_final_record():
+        path = _emit(_result("zest_a"), _result("zest_b", error="boom"))
+        os.truncate(path, os.path.getsize(path) - 1)
+        assert _read(path) == [_result("zest_a")]
+
+    def it_stops_at_a_truncated_length_prefix():
+        path = _emit(_result("zest_a"))
+        with open(path, "ab") as f:
+            f.write(b"\x01\x00")
+        assert _read(path) == [_result("zest_a")]
+
+    zest()
+
+
+def zest_finder_prefilters():
+    def _find(root, match_string=None):
+        root_zests, allow_to_run, errors = zest_finder.find_zests(
+            root, ".", ["__all__"], None, match_string=match_string
+        )
+        assert errors == []
+        return set(root_zests.keys()), allow_to_run
+
+    def _probe(root_name, it_name):
+        return (
+            "from zest import zest\n\n"
+            f"def {root_name}():\n"
+            f"    def {it_name}():\n        pass\n\n"
+            "    zest()\n"
+        )
+
+    def it_skips_modules_without_a_root_zest_def():
+        with _tmp_zests_root(
+            zest_no_roots='NAME = "zest_not_a_def"\n\ndef _helper():\n    pass\n',
+            zest_only_in_a_docstring='"""\ndef zest_in_a_docstring():\n"""\n',
+            # A syntax error would be reported had this module been parsed
+            zest_unparsed="def _helper(:\n",
+        ) as root:
+            assert _find(root) == (set(), set())
+
+    def it_finds_a_root_zest_indented_under_a_with():
+        source = (
+            "from zest import zest\n\n"
+            "with open(__file__):\n"
+            "    def zest_inside_with():\n"
+            "        def it_runs():\n            pass\n\n"
+            "        zest()\n"
+        )
+        with _tmp_zests_root(zest_with=source) as root:
+            root_names, allow_to_run = _find(root)
+            assert root_names == {"zest_inside_with"}
+            assert "zest_inside_with.it_runs" in allow_to_run
+
+    def it_only_parses_modules_that_contain_the_match_string_prefix():
+        with _tmp_zests_root(
+            zest_aaa=_probe("zest_aaa", "it_xxx"),
+            zest_bbb=_probe("zest_bbb", "it_yyy"),
+            # A syntax error would be reported had this module been parsed
+            zest_ccc="def zest_ccc(:\n",
+        ) as root:
+            assert _find(root, "zest_aaa.it_xxx") == ({"zest_aaa"}, {"zest_aaa", "zest_aaa.it_xxx"})
+            assert _find(root, "it_yyy") == ({"zest_bbb"}, {"zest_bbb", "zest_bbb.it_yyy"})
+            assert _find(root, "it_zzz") == (set(), set())
+
+    zest()
+
+
+def zest_finder_parallel_parse():
+    def it_matches_the_serial_parse_across_the_threshold():
+        paths_and_sources = [
+            (
+                f"zest_m{i}.py",
+                (
+                    "from zest import zest\n\n"
+                    f"def zest_m{i}():\n"
+                    "    def it_runs():\n        pass\n\n"
+                    "    zest()\n"
+                ).encode(),
+            )
+            for i in range(zest_finder._PARALLEL_PARSE_MIN_MODULES + 5)
+        ]
+        paths_and_sources += [
+            ("zest_no_root.py", b"def _helper():\n    pass\n"),
+            ("zest_broken.py", b"def zest_broken(:\n"),
+        ]
+        serial = [zest_finder._parse_module(x) for x in paths_and_sources]
+
+        # Pretend to have several cpus so that the pool is used on any machine
+        cpu_count = os.cpu_count
+        os.cpu_count = lambda: 4
+        try:
+            parallel = zest_finder._parse_modules(paths_and_sources)
+        finally:
+            os.cpu_count = cpu_count
+
+        assert parallel == serial
+        assert serial[0][0][0].name == "zest_m0"
+        assert serial[-2] == ([], None)
+        assert serial[-1] == (None, 1)
+
+    zest()
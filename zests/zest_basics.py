@@ -402,6 +402,18 @@ def zest_hard_exit():
     os.kill(os.getpid(), signal.SIGKILL)
 
 
+@zest.skip(reason="runs_in_subprocess")
+@zest.run_in_subprocess()
+def zest_runs_in_subprocess():
+    print("from the subprocess")
+
+
+@zest.skip(reason="exits_zero_in_subprocess")
+@zest.run_in_subprocess()
+def zest_exits_zero_in_subprocess():
+    sys.exit(0)
+
+
 """
 def zest_parameter_list():
     saw = {1: False, 2: False}